@@ -1,13 +1,36 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, File, UploadFile, Form
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
-import httpx
-import json
+from pydantic import BaseModel, ConfigDict
+import aiohttp
+import asyncio
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+import orjson
+import pybase64
 import os
-from typing import List, Dict
+import time
+from typing import AsyncIterator, List, Dict, Optional
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One shared session so upstream connections are kept alive between requests.
+    # Idle TLS connections to Groq are held for 60s (aiohttp's default is 15s) so
+    # a user's next turn usually skips the handshake. The 120s limit applies to
+    # each read, not the whole reply, so long generations aren't cut off.
+    app.state.http = aiohttp.ClientSession(
+        timeout=aiohttp.ClientTimeout(total=None, connect=5, sock_read=120),
+        connector=aiohttp.TCPConnector(limit=200, ttl_dns_cache=300, keepalive_timeout=60),
+    )
+    app.state.redis = aioredis.from_url(REDIS_URL, decode_responses=True)
+    yield
+    await app.state.http.close()
+    await app.state.redis.aclose()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -16,18 +39,136 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# In production use Redis/DB instead of memory
-conversations: Dict[str, List[Dict]] = {}
-
 # IMPORTANT: Set this in Render Environment Variables
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
+# "groq" (cloud, text only) or "ollama" (local, text + images)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "groq" if GROQ_API_KEY else "ollama")
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+# Text model built from ./Modelfile (qwen2.5:0.5b with OLLAMA_SYSTEM_PROMPT baked in):
+#   ollama create app-assistant -f Modelfile
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "app-assistant")
+# First turns skip Ollama's chat template only for models known to use ChatML
+# (the default one does); set OLLAMA_CHATML=1 or 0 to override for other models
+OLLAMA_CHATML = os.getenv("OLLAMA_CHATML", "1" if OLLAMA_MODEL == "app-assistant" else "0") == "1"
+
+# Conversation history lives in Redis so it survives restarts and is shared across workers
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+HISTORY_TTL = 3600  # seconds of inactivity before a session is dropped
+# Only the most recent turns are kept, so the prompt sent upstream stays bounded
+MAX_TURNS = int(os.getenv("MAX_TURNS", "8"))
+
+# Tokens are coalesced into one SSE frame per ~1KB of text or 20ms
+FLUSH_CHARS = 1024
+FLUSH_INTERVAL = 0.02  # seconds
+# A session's turn holds its lock until the reply is stored, so concurrent
+# requests for the same session can't interleave their history writes. The
+# lock is refreshed while the turn runs and only expires if a worker dies.
+LOCK_TIMEOUT = 60  # seconds
+
+# Ollama runs only a few generations at once; extra requests wait here instead
+# of piling up inside Ollama (the limit applies per uvicorn worker). A request
+# that can't get a slot within OLLAMA_QUEUE_TIMEOUT is told the server is busy
+ollama_sem = asyncio.Semaphore(int(os.getenv("OLLAMA_PAR", "2")))
+OLLAMA_QUEUE_TIMEOUT = float(os.getenv("OLLAMA_QUEUE_TIMEOUT", "30"))  # seconds
+
+# /ping and /models share one cached copy of Ollama's model list, so frequent
+# health checks don't hit Ollama every time
+MODELS_TTL = 5.0  # seconds
+
+# Uploads are base64-encoded while they are read; a multiple of 3 bytes keeps
+# each encoded piece free of padding so the pieces can simply be joined
+IMAGE_CHUNK = 3 * 21846  # ~64KB
+
+
+def history_key(session_id: str) -> str:
+    return f"conv:{session_id}"
+
+
+def lock_key(session_id: str) -> str:
+    return f"lock:{session_id}"
+
+
+async def load_history(session_id: str) -> List[Dict]:
+    messages = await app.state.redis.lrange(history_key(session_id), 0, -1)
+    return [orjson.loads(m) for m in messages]
+
+
+async def append_history(session_id: str, message: Dict):
+    key = history_key(session_id)
+    async with app.state.redis.pipeline(transaction=True) as pipe:
+        pipe.rpush(key, orjson.dumps(message))
+        pipe.ltrim(key, -MAX_TURNS * 2, -1)
+        pipe.expire(key, HISTORY_TTL)
+        await pipe.execute()
+
+
+async def keep_lock(lock):
+    """Refresh a lock's expiry every LOCK_TIMEOUT / 3 seconds until cancelled"""
+    try:
+        while True:
+            await asyncio.sleep(LOCK_TIMEOUT / 3)
+            await lock.reacquire()
+    except RedisError:
+        pass  # Lost the lock or Redis itself; the turn carries on without the refresh
+
+
+async def release_lock(lock):
+    try:
+        await lock.release()
+    except RedisError:
+        pass  # Already expired, or Redis is down and the lock will expire on its own
+
+
+async def iter_lines(response: aiohttp.ClientResponse):
+    """Yield the upstream body line by line, reading it in 8KB chunks"""
+    buf = bytearray()
+    async for chunk in response.content.iter_chunked(8192):
+        buf.extend(chunk)
+        while (nl := buf.find(b"\n")) != -1:
+            line = bytes(buf[:nl]).rstrip(b"\r")
+            del buf[:nl + 1]
+            yield line
+    if buf:
+        yield bytes(buf)
+
+
+async def upstream_error(response: aiohttp.ClientResponse) -> str:
+    """Pull the error message out of a failed upstream reply"""
+    try:
+        # Groq sends {"error": {"message": ...}}, Ollama sends {"error": "..."}
+        error = (await response.json(content_type=None)).get("error")
+    except (ValueError, AttributeError):
+        error = None  # Not a JSON object, e.g. an HTML 502 page from a proxy
+    if isinstance(error, dict):
+        error = error.get("message")
+    if isinstance(error, str) and error:
+        return error
+    return f"{response.status} {response.reason}"
+
+
+async def encode_upload(upload: UploadFile) -> str:
+    """Base64-encode an upload chunk by chunk instead of reading it whole"""
+    encoded = bytearray()
+    rest = b""
+    while chunk := await upload.read(IMAGE_CHUNK):
+        chunk = rest + chunk
+        cut = len(chunk) - len(chunk) % 3
+        encoded += pybase64.b64encode(memoryview(chunk)[:cut])
+        rest = chunk[cut:]
+    encoded += pybase64.b64encode(rest)
+    return encoded.decode()
+
+
 class ChatRequest(BaseModel):
+    model_config = ConfigDict(extra='ignore')
+
     message: str
     session_id: str = "default"
+    image_base64: Optional[str] = None  # For image input
 
 
-SYSTEM_PROMPT = """You are a professional AI assistant.
+GROQ_SYSTEM_PROMPT = """You are a professional AI assistant.
 - Solve math step-by-step.
 - Write correct and efficient code.
 - Explain clearly and concisely.
@@ -35,98 +176,420 @@ SYSTEM_PROMPT = """You are a professional AI assistant.
 - Never invent information about yourself.
 """
 
+# Also baked into the Ollama text model by ./Modelfile; keep the two in sync
+OLLAMA_SYSTEM_PROMPT = """Identity rules (MANDATORY):
+- You are NOT ChatGPT.
+- You are NOT Qwen.
+- You are NOT created by Alibaba, OpenAI, Google, or any company.
+- You must NEVER claim a username, model name, or training origin.
+- If asked about yourself, say you are a general AI assistant created for this app.
+
+Behavior rules:
+- Automatically understand the user's question.
+- Solve math problems step-by-step.
+- Write correct and efficient code when asked.
+- Explain theory clearly and concisely.
+- Keep answers accurate and to the point.
+- Do not hallucinate facts about yourself.
+- When analyzing images, describe what you see in detail."""
+
+# Qwen's ChatML template after the user's text, for raw first-turn prompts
+CHATML_SUFFIX = "<|im_end|>\n<|im_start|>assistant\n"
+
+# Keep proxies (nginx, Cloudflare) from buffering or caching the event stream
+SSE_HEADERS = {"X-Accel-Buffering": "no", "Cache-Control": "no-cache"}
+# Upstream bodies (history plus base64 images) are encoded by orjson straight to bytes
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+def error_frame(message: str) -> bytes:
+    return b"data: " + orjson.dumps({'error': message, 'done': True}) + b"\n\n"
+
+
+# Fixed SSE frames, encoded once
+DONE_FRAME = b'data: {"chunk":"","done":true}\n\n'
+MISSING_KEY_FRAME = error_frame("GROQ_API_KEY not set in environment")
+NO_VISION_FRAME = error_frame("Image input needs the Ollama backend (LLM_BACKEND=ollama)")
+GROQ_CONNECT_ERROR_FRAME = error_frame("AI is currently unavailable. Could not reach the Groq API")
+OLLAMA_CONNECT_ERROR = "AI is currently unavailable. Make sure Ollama is running (ollama serve)"
+OLLAMA_CONNECT_ERROR_FRAME = error_frame(OLLAMA_CONNECT_ERROR)
+OLLAMA_CONNECT_ERROR_IMAGE_FRAME = error_frame(
+    OLLAMA_CONNECT_ERROR + "\nFor images, make sure you have llava installed: ollama pull llava"
+)
+TIMEOUT_FRAME = error_frame("AI took too long to respond. Please try again")
+HISTORY_ERROR_FRAME = error_frame("Chat history store unavailable. Please try again later")
+BUSY_FRAME = error_frame("Server is busy, please try again in a moment")
+
+
+class ServerBusy(Exception):
+    """Raised when a request waits too long for a free Ollama slot"""
+
+
+class GroqAdapter:
+    """Groq's OpenAI-compatible chat API (text only)"""
+
+    vision = False
+
+    def __init__(self, api_key: Optional[str], model: str, system_prompt: str):
+        self.api_key = api_key
+        self.model = model
+        self.system_msg = {"role": "system", "content": system_prompt}
+
+    def check(self) -> Optional[bytes]:
+        """Return an error frame if the backend can't serve requests"""
+        return None if self.api_key else MISSING_KEY_FRAME
+
+    def connect_error(self, has_image: bool) -> bytes:
+        return GROQ_CONNECT_ERROR_FRAME
+
+    async def status(self) -> Dict:
+        return {"status": "server is running (Groq cloud mode)"}
+
+    async def models(self) -> List[Dict]:
+        return [{"name": self.model, "has_vision": False}]
+
+    async def stream(self, history: List[Dict], has_image: bool) -> AsyncIterator[str]:
+        async with app.state.http.post(
+            "https://api.groq.com/openai/v1/chat/completions",
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json"
+            },
+            data=orjson.dumps({
+                "model": self.model,
+                "messages": [self.system_msg, *history],
+                "stream": True,
+                "temperature": 0.7
+            })
+        ) as response:
+            if response.status != 200:
+                # e.g. an invalid API key or a rate limit
+                raise RuntimeError(await upstream_error(response))
+
+            async for line in iter_lines(response):
+
+                if line.startswith(b"data: "):
+                    data_str = line[6:]
+
+                    if data_str == b"[DONE]":
+                        return
+
+                    try:
+                        delta = orjson.loads(data_str)["choices"][0]["delta"].get("content")
+                    except (orjson.JSONDecodeError, KeyError, IndexError, TypeError):
+                        continue
+
+                    if delta:
+                        yield delta
+
+
+class OllamaAdapter:
+    """Local Ollama server, with a vision model for image turns"""
+
+    vision = True
+
+    def __init__(self, url: str, text_model: str, vision_model: str, system_prompt: str,
+                 chatml: bool = False):
+        self.url = url
+        self.text_model = text_model
+        self.vision_model = vision_model
+        self.system_msg = {"role": "system", "content": system_prompt}
+        self.chatml = chatml  # text_model uses ChatML, so first turns can be sent raw
+        # ChatML up to the user's text; the same for every first turn
+        self.chatml_prefix = f"<|im_start|>system\n{system_prompt}<|im_end|>\n<|im_start|>user\n"
+        self.models_cache = {"models": [], "expires": 0.0}  # this server's model list
+
+    def check(self) -> Optional[bytes]:
+        """Return an error frame if the backend can't serve requests"""
+        return None
+
+    def connect_error(self, has_image: bool) -> bytes:
+        return OLLAMA_CONNECT_ERROR_IMAGE_FRAME if has_image else OLLAMA_CONNECT_ERROR_FRAME
+
+    async def fetch_models(self) -> List[Dict]:
+        """Get Ollama's installed models, cached for MODELS_TTL seconds"""
+        now = time.monotonic()
+        if now < self.models_cache["expires"]:
+            return self.models_cache["models"]
+
+        async with app.state.http.get(
+            f"{self.url}/api/tags",
+            timeout=aiohttp.ClientTimeout(total=5)
+        ) as response:
+            response.raise_for_status()
+            models = (await response.json()).get("models", [])
+
+        self.models_cache["models"] = models
+        self.models_cache["expires"] = now + MODELS_TTL
+        return models
+
+    async def status(self) -> Dict:
+        try:
+            models = await self.fetch_models()
+            # Check for vision models
+            has_vision = any("llava" in m["name"] or "vision" in m["name"]
+                             for m in models)
+            return {
+                "status": "server is working",
+                "ollama": "connected",
+                "vision_available": has_vision
+            }
+        except:
+            return {
+                "status": "server is working",
+                "ollama": "disconnected",
+                "vision_available": False
+            }
+
+    async def models(self) -> List[Dict]:
+        try:
+            models = await self.fetch_models()
+        except:
+            return []
+        return [
+            {
+                "name": m["name"],
+                "has_vision": "llava" in m["name"] or "vision" in m["name"]
+            }
+            for m in models
+        ]
+
+    async def stream(self, history: List[Dict], has_image: bool) -> AsyncIterator[str]:
+        options = {
+            "temperature": 0.7,
+            "num_predict": 2000
+        }
+
+        if has_image:
+            # The vision model has no system prompt of its own
+            endpoint = "/api/chat"
+            payload = {
+                "model": self.vision_model,
+                "messages": [self.system_msg, *history],
+                "stream": True,
+                "options": options
+            }
+        elif self.chatml and len(history) == 1:
+            # First turn: send a ready-made ChatML prompt to /api/generate so
+            # Ollama skips chat templating and every first turn shares the
+            # same system-prompt prefix
+            endpoint = "/api/generate"
+            payload = {
+                "model": self.text_model,
+                "prompt": self.chatml_prefix + history[0]["content"] + CHATML_SUFFIX,
+                "raw": True,
+                "stream": True,
+                "options": options
+            }
+        else:
+            # The text model carries the system prompt itself (see Modelfile)
+            endpoint = "/api/chat"
+            payload = {
+                "model": self.text_model,
+                "messages": history,
+                "stream": True,
+                "options": options
+            }
+
+        try:
+            await asyncio.wait_for(ollama_sem.acquire(), OLLAMA_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise ServerBusy from None
+
+        try:
+            async with app.state.http.post(
+                f"{self.url}{endpoint}",
+                headers=JSON_HEADERS,
+                data=orjson.dumps(payload)
+            ) as response:
+                if response.status != 200:
+                    # e.g. "model 'app-assistant' not found" before the Modelfile was created
+                    raise RuntimeError(await upstream_error(response))
+
+                async for line in iter_lines(response):
+                    if line.strip():
+                        try:
+                            data = orjson.loads(line)
+                        except orjson.JSONDecodeError:
+                            continue
+
+                        # /api/generate streams "response", /api/chat streams "message"
+                        chunk = data.get("response") or data.get("message", {}).get("content")
+                        if chunk:
+                            yield chunk
+
+                        if data.get("done", False):
+                            return
+        finally:
+            ollama_sem.release()
+
+
+BACKENDS = {
+    "groq": GroqAdapter(GROQ_API_KEY, "llama3-70b-8192", GROQ_SYSTEM_PROMPT),
+    "ollama": OllamaAdapter(OLLAMA_URL, OLLAMA_MODEL, "llava", OLLAMA_SYSTEM_PROMPT, OLLAMA_CHATML),
+}
+backend = BACKENDS[LLM_BACKEND]
+
 
 @app.get("/ping")
 async def ping():
-    return {"status": "server is running (Groq cloud mode)"}
+    """Health check endpoint"""
+    return await backend.status()
+
+
+@app.get("/models")
+async def get_models():
+    """Get available models"""
+    return {"models": await backend.models()}
 
 
 @app.post("/chat")
 async def chat(req: ChatRequest):
+    """Streaming chat endpoint with optional image support"""
+    return StreamingResponse(
+        stream_chat(req),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+
+@app.post("/chat/image")
+async def chat_with_image(
+    message: str = Form(...),
+    session_id: str = Form("default"),
+    image: UploadFile = File(...)
+):
+    """Handle chat with image upload"""
+
+    # Read and encode image
+    image_base64 = await encode_upload(image)
+
+    # Create request (form fields are already validated by FastAPI)
+    req = ChatRequest.model_construct(
+        message=message,
+        session_id=session_id,
+        image_base64=image_base64
+    )
+
     return StreamingResponse(
         stream_chat(req),
-        media_type="text/event-stream"
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
     )
 
 
 async def stream_chat(req: ChatRequest):
+    """Stream the reply from the configured backend as SSE frames"""
 
-    if not GROQ_API_KEY:
-        yield f"data: {json.dumps({'error': 'GROQ_API_KEY not set in environment', 'done': True})}\n\n"
-        return
+    has_image = req.image_base64 is not None
 
-    if req.session_id not in conversations:
-        conversations[req.session_id] = []
+    setup_error = backend.check()
+    if setup_error:
+        yield setup_error
+        return
 
-    conversations[req.session_id].append({
-        "role": "user",
-        "content": req.message
-    })
+    if has_image and not backend.vision:
+        yield NO_VISION_FRAME
+        return
 
-    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
-    messages.extend(conversations[req.session_id])
+    # Wait for any in-flight turn of this session to finish
+    lock = app.state.redis.lock(lock_key(req.session_id), timeout=LOCK_TIMEOUT)
+    try:
+        await lock.acquire()
+    except RedisError:
+        yield HISTORY_ERROR_FRAME
+        return
+    keeper = asyncio.create_task(keep_lock(lock))
 
     try:
-        async with httpx.AsyncClient(timeout=120.0) as client:
-
-            async with client.stream(
-                "POST",
-                "https://api.groq.com/openai/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {GROQ_API_KEY}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": "llama3-70b-8192",
-                    "messages": messages,
-                    "stream": True,
-                    "temperature": 0.7
-                }
-            ) as response:
+        # Add to history (images are not stored, they are only sent with this turn)
+        await append_history(req.session_id, {
+            "role": "user",
+            "content": req.message
+        })
 
-                full_response = ""
+        history = await load_history(req.session_id)
 
-                async for line in response.aiter_lines():
+        # Add image if present
+        if has_image:
+            history[-1]["images"] = [req.image_base64]
 
-                    if line and line.startswith("data: "):
-                        data_str = line.replace("data: ", "")
+        full_response = ""
+        pending = []
+        pending_len = 0
+        last_flush = time.monotonic()
 
-                        if data_str == "[DONE]":
-                            conversations[req.session_id].append({
-                                "role": "assistant",
-                                "content": full_response
-                            })
+        async for chunk in backend.stream(history, has_image):
+            full_response += chunk
+            pending.append(chunk)
+            pending_len += len(chunk)
 
-                            yield f"data: {json.dumps({'done': True})}\n\n"
-                            break
+            # Send buffered chunks to frontend
+            now = time.monotonic()
+            if pending_len >= FLUSH_CHARS or now - last_flush >= FLUSH_INTERVAL:
+                yield b"data: " + orjson.dumps({'chunk': "".join(pending), 'done': False}) + b"\n\n"
+                pending.clear()
+                pending_len = 0
+                last_flush = now
 
-                        try:
-                            data = json.loads(data_str)
-                            delta = data["choices"][0]["delta"].get("content", "")
+        if pending:
+            yield b"data: " + orjson.dumps({'chunk': "".join(pending), 'done': False}) + b"\n\n"
 
-                            if delta:
-                                full_response += delta
-                                yield f"data: {json.dumps({'chunk': delta, 'done': False})}\n\n"
+        # Save assistant response
+        await append_history(req.session_id, {
+            "role": "assistant",
+            "content": full_response
+        })
 
-                        except:
-                            continue
+        yield DONE_FRAME
+
+    except aiohttp.ClientConnectorError:
+        yield backend.connect_error(has_image)
+
+    except ServerBusy:
+        yield BUSY_FRAME
+
+    except RedisError:
+        yield HISTORY_ERROR_FRAME
+
+    except asyncio.TimeoutError:
+        yield TIMEOUT_FRAME
 
     except Exception as e:
-        yield f"data: {json.dumps({'error': str(e), 'done': True})}\n\n"
+        yield error_frame(f"Error: {str(e)}")
+
+    finally:
+        keeper.cancel()
+        # Shielded so a client disconnect can't leave the session locked
+        await asyncio.shield(release_lock(lock))
 
 
 @app.delete("/chat/clear")
 async def clear_chat(session_id: str = "default"):
-    conversations[session_id] = []
+    """Clear conversation history"""
+    await app.state.redis.delete(history_key(session_id))
     return {"status": "cleared"}
 
 
 @app.get("/chat/history")
 async def get_history(session_id: str = "default"):
-    return {"history": conversations.get(session_id, [])}
+    """Get conversation history"""
+    return {"history": await load_history(session_id)}
 
 
 if __name__ == "__main__":
     import uvicorn
-    print("🚀 Starting CLOUD AI backend (Groq)")
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    if LLM_BACKEND == "groq":
+        print("🚀 Starting CLOUD AI backend (Groq)")
+    else:
+        print("🚀 Starting AI Chat with Vision & Voice Support...")
+        print("📡 Server: http://127.0.0.1:8000")
+        print("🤖 Make sure Ollama is running: ollama serve")
+        print("🧩 Create the chat model once: ollama create app-assistant -f Modelfile")
+        print("👁️ For image support: ollama pull llava")
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=int(os.getenv("WEB_CONCURRENCY", "1"))
+    )
@@ -5,11 +5,14 @@ Installs necessary models and tests all features
 """
 
 import asyncio
+import codecs
 import httpx
-import subprocess
 import sys
 import os
 
+# Setup files live next to this script, wherever it is run from
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
 async def check_ollama():
     """Check if Ollama is running"""
     print("🔍 Checking Ollama...")
@@ -25,56 +28,86 @@ async def check_ollama():
     print("   Start it with: ollama serve")
     return False, []
 
-def install_llava():
+async def run_command(*args, show_output=True):
+    """Run a command without blocking the event loop, returning its exit code"""
+    proc = await asyncio.create_subprocess_exec(
+        *args,
+        stdout=asyncio.subprocess.PIPE if show_output else asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.STDOUT if show_output else asyncio.subprocess.DEVNULL
+    )
+    if show_output:
+        # Read raw chunks so carriage-return progress bars are echoed as-is; the
+        # incremental decoder keeps multi-byte characters split across reads whole
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        while chunk := await proc.stdout.read(4096):
+            sys.stdout.write(decoder.decode(chunk))
+            sys.stdout.flush()
+        sys.stdout.write(decoder.decode(b"", final=True))
+    return await proc.wait()
+
+async def pull_model(name):
+    """Pull an Ollama model, streaming its download progress"""
+    try:
+        return await run_command("ollama", "pull", name) == 0
+    except FileNotFoundError:
+        print("❌ 'ollama' command not found!")
+        print("   Please install Ollama from: https://ollama.ai/download")
+        return False
+
+async def create_assistant_model():
+    """Build the app-assistant chat model from the Modelfile"""
+    print("\n🧩 Creating chat model (app-assistant) from Modelfile...")
+    modelfile = os.path.join(BASE_DIR, "Modelfile")
+    try:
+        if await run_command("ollama", "create", "app-assistant", "-f", modelfile) == 0:
+            print("✅ Chat model created!")
+            return True
+    except FileNotFoundError:
+        print("❌ 'ollama' command not found!")
+        return False
+    print("❌ Failed to create app-assistant")
+    return False
+
+async def install_llava():
     """Install llava vision model"""
     print("\n📥 Installing Llava vision model...")
     print("   This may take 5-10 minutes (downloading ~4.5GB)")
     
     try:
-        result = subprocess.run(
-            ["ollama", "pull", "llava"],
-            capture_output=True,
-            text=True
-        )
-        if result.returncode == 0:
+        if await pull_model("llava"):
             print("✅ Llava installed successfully!")
             return True
         else:
-            print(f"❌ Failed to install llava: {result.stderr}")
+            print("❌ Failed to install llava")
             return False
-    except FileNotFoundError:
-        print("❌ 'ollama' command not found!")
-        print("   Please install Ollama from: https://ollama.ai/download")
-        return False
     except Exception as e:
         print(f"❌ Error: {e}")
         return False
 
-def install_python_deps():
+async def install_python_deps():
     """Install Python dependencies"""
     print("\n📦 Installing Python dependencies...")
     
     try:
-        result = subprocess.run(
-            [sys.executable, "-m", "pip", "install", "-r", "requirements_enhanced.txt"],
-            capture_output=True,
-            text=True
+        returncode = await run_command(
+            sys.executable, "-m", "pip", "install", "-r", os.path.join(BASE_DIR, "requirements.txt"),
+            show_output=False
         )
-        if result.returncode == 0:
+        if returncode == 0:
             print("✅ Python dependencies installed!")
             return True
         else:
             # Try individual install
-            deps = ["fastapi", "uvicorn[standard]", "httpx", "pydantic", "python-multipart"]
+            deps = ["fastapi", "uvicorn[standard]", "httpx", "aiohttp", "redis", "orjson", "pybase64", "pydantic", "python-multipart"]
             for dep in deps:
-                subprocess.run([sys.executable, "-m", "pip", "install", dep], 
-                             capture_output=True)
+                await run_command(sys.executable, "-m", "pip", "install", dep,
+                                  show_output=False)
             print("✅ Python dependencies installed!")
             return True
     except Exception as e:
         print(f"⚠️  Warning: {e}")
         print("   You may need to install manually:")
-        print("   pip install fastapi uvicorn httpx pydantic python-multipart")
+        print("   pip install fastapi uvicorn httpx aiohttp redis orjson pybase64 pydantic python-multipart")
         return False
 
 async def test_vision():
@@ -118,6 +151,7 @@ async def main():
     # Step 2: Check for existing models
     print(f"\n📦 Found {len(models)} models:")
     has_text_model = False
+    has_assistant_model = False
     has_vision_model = False
     
     for model in models:
@@ -125,27 +159,35 @@ async def main():
         print(f"   - {name}")
         if "qwen" in name or "llama" in name or "mistral" in name:
             has_text_model = True
+        if name.startswith("app-assistant"):
+            has_assistant_model = True
         if "llava" in name or "vision" in name:
             has_vision_model = True
     
-    # Step 3: Install models if needed
-    if not has_text_model:
-        print("\n📥 Installing text model (qwen2.5:0.5b)...")
-        subprocess.run(["ollama", "pull", "qwen2.5:0.5b"], capture_output=True)
-        print("✅ Text model installed!")
-    
+    # Step 3: Decide which models to install
+    install_vision = False
     if not has_vision_model:
         print("\n❓ Llava vision model not found.")
         response = input("   Install llava for image analysis? (y/n): ").lower()
         if response == 'y':
-            install_llava()
+            install_vision = True
         else:
             print("   ⚠️  Skipping vision model (image features won't work)")
     else:
         print("✅ Vision model already installed!")
     
-    # Step 4: Install Python dependencies
-    install_python_deps()
+    async def install_models():
+        if not has_text_model:
+            print("\n📥 Installing text model (qwen2.5:0.5b)...")
+            if await pull_model("qwen2.5:0.5b"):
+                print("✅ Text model installed!")
+        if not has_assistant_model:
+            await create_assistant_model()
+        if install_vision:
+            await install_llava()
+    
+    # Step 4: Pull models and install Python dependencies in parallel
+    await asyncio.gather(install_models(), install_python_deps())
     
     # Step 5: Test vision
     if has_vision_model or await test_vision():
@@ -166,7 +208,7 @@ async def main():
     
     print("\n🎉 Setup Complete!")
     print("\n📝 Next Steps:")
-    print("   1. Start backend:  python main_with_vision.py")
+    print("   1. Start backend:  LLM_BACKEND=ollama python main.py")
     print("   2. Open browser:   index_enhanced.html")
     print("   3. Try features:")
     print("      - 📷 Click camera icon to upload image")
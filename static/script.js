@@ -309,13 +309,18 @@ async function sendMessage() {
     const reader = response.body.getReader();
     const decoder = new TextDecoder();
     let aiResponse = "";
+    let buffer = "";
+    let finished = false;
 
-    while (true) {
+    // Stop reading once the server has sent its final frame
+    while (!finished) {
       const { done, value } = await reader.read();
       if (done) break;
 
-      const chunk = decoder.decode(value);
-      const lines = chunk.split('\n');
+      // Frames can be split across reads, so keep the trailing partial line
+      buffer += decoder.decode(value, { stream: true });
+      const lines = buffer.split('\n');
+      buffer = lines.pop();
 
       for (const line of lines) {
         if (line.startsWith('data: ')) {
@@ -324,6 +329,7 @@ async function sendMessage() {
 
             if (data.error) {
               updateAIMessage(currentAIMessage, `<span class="error">❌ ${data.error}</span>`);
+              finished = true;
               break;
             }
 
@@ -336,6 +342,7 @@ async function sendMessage() {
               updateAIMessage(currentAIMessage, aiResponse, true);
               // Speak the response if voice is enabled
               speakText(aiResponse);
+              finished = true;
               break;
             }
           } catch (e) {